@@ -0,0 +1,314 @@
+# Record Linkage of Zagat and Fodor's Restaurant Listings
+
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import process
+from rapidfuzz.distance import JaroWinkler
+
+import util
+
+COLUMNS = ["index", "rest", "city", "address"]
+# Category tuples are encoded as code = rest * 9 + city * 3 + address,
+# with each component indexing into CATEGORIES (0..26 overall).
+CATEGORIES = ["low", "medium", "high"]
+
+# Bin edges matching util.get_jw_category: digitize against these maps a
+# score to its index in CATEGORIES.
+CATEGORY_BINS = np.array([util.THRESH1, util.THRESH2])
+
+UNMATCH_SIZE = 1000
+UNMATCH_SEED = 1234
+
+# The seeded unmatch sample is fixed, so the tuple frequencies only
+# change when the source CSVs do; they are cached here across runs,
+# keyed on the CSVs' modification times.
+PROBS_CACHE = "tuple_probs.npz"
+SOURCE_CSVS = ("zagat.csv", "fodors.csv", "known_links.csv")
+
+# Class labels assigned to each category tuple.
+MATCH, UNMATCH, POSSIBLE, DROP = 0, 1, 2, 3
+
+
+def load_data():
+    '''
+    Load the Zagat and Fodor's listings and the known links between them.
+
+    Returns: (zagat df, fodors df, known links df)
+    '''
+
+    zagat = pd.read_csv("zagat.csv", names=COLUMNS, index_col="index",
+                        engine="pyarrow")
+    fodors = pd.read_csv("fodors.csv", names=COLUMNS, index_col="index",
+                         engine="pyarrow")
+    known = pd.read_csv("known_links.csv", names=["zagat", "fodors"],
+                        engine="pyarrow")
+
+    return zagat, fodors, known
+
+
+def create_matches(zagat, fodors, known):
+    '''
+    Build a dataframe of known matching pairs, one row per link, with the
+    Zagat columns suffixed _z and the Fodor's columns suffixed _f.
+
+    Inputs:
+        zagat (df): Zagat listings
+        fodors (df): Fodor's listings
+        known (df): known (zagat, fodors) index pairs
+
+    Returns: dataframe of matched pairs
+    '''
+
+    z = zagat.loc[known["zagat"]].reset_index(drop=True).add_suffix("_z")
+    f = fodors.loc[known["fodors"]].reset_index(drop=True).add_suffix("_f")
+    return pd.concat([z, f], axis=1)
+
+
+def create_unmatches(zagat, fodors):
+    '''
+    Build a dataframe of (almost certainly) unmatched pairs by sampling
+    random Zagat and Fodor's rows independently.
+
+    Inputs:
+        zagat (df): Zagat listings
+        fodors (df): Fodor's listings
+
+    Returns: dataframe of unmatched pairs
+    '''
+
+    rng = np.random.default_rng(UNMATCH_SEED)
+    zi = rng.integers(len(zagat), size=UNMATCH_SIZE)
+    fi = rng.integers(len(fodors), size=UNMATCH_SIZE)
+
+    z = zagat.iloc[zi].reset_index(drop=True).add_suffix("_z")
+    f = fodors.iloc[fi].reset_index(drop=True).add_suffix("_f")
+    return pd.concat([z, f], axis=1)
+
+
+def tuple_probs(df):
+    '''
+    Estimate the probability of each (rest, city, address) category tuple
+    from a dataframe of pairs.
+
+    Inputs:
+        df (df): pairs with _z and _f suffixed columns
+
+    Returns: float array of 27 relative frequencies, indexed by tuple code
+    '''
+
+    # Score each column pairwise in C, categorize, and encode the tuples
+    # as ints 0..26 so counting collapses to one bincount.
+    keys = np.zeros(len(df), dtype=np.int8)
+    for col, weight in (("rest", 9), ("city", 3), ("address", 1)):
+        sims = process.cpdist(df[col + "_z"], df[col + "_f"],
+                              scorer=JaroWinkler.normalized_similarity,
+                              dtype=np.float32, workers=-1)
+        keys += np.digitize(sims, CATEGORY_BINS).astype(np.int8) * weight
+
+    counts = np.bincount(keys, minlength=27)
+    return counts / counts.sum()
+
+
+def load_tuple_probs(zagat, fodors, known):
+    '''
+    Return the match and unmatch tuple frequencies, reading them from
+    the on-disk cache when it is present and still matches the source
+    CSVs' modification times, and computing and saving them otherwise.
+
+    Inputs:
+        zagat (df): Zagat listings
+        fodors (df): Fodor's listings
+        known (df): known (zagat, fodors) index pairs
+
+    Returns: (match frequencies, unmatch frequencies) arrays
+    '''
+
+    mtimes = np.array([os.path.getmtime(f) for f in SOURCE_CSVS])
+    try:
+        cached = np.load(PROBS_CACHE)
+        if np.array_equal(cached["mtimes"], mtimes):
+            return cached["match_freqs"], cached["unmatch_freqs"]
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        # Missing, corrupt, or old-format cache: recompute and rewrite.
+        pass
+
+    match_freqs = tuple_probs(create_matches(zagat, fodors, known))
+    unmatch_freqs = tuple_probs(create_unmatches(zagat, fodors))
+    np.savez(PROBS_CACHE, match_freqs=match_freqs,
+             unmatch_freqs=unmatch_freqs, mtimes=mtimes)
+    return match_freqs, unmatch_freqs
+
+
+def create_sets(match_freqs, unmatch_freqs, mu, lambda_):
+    '''
+    Partition the 27 tuple codes into match, possible, and unmatch code
+    arrays given the maximum false positive rate (mu) and false negative
+    rate (lambda_).
+
+    Inputs:
+        match_freqs (array): tuple frequencies among known matches
+        unmatch_freqs (array): tuple frequencies among unmatches
+        mu (float): maximum false positive rate
+        lambda_ (float): maximum false negative rate
+
+    Returns: (match codes, possible codes, unmatch codes) int arrays
+    '''
+
+    zero_both = (match_freqs == 0) & (unmatch_freqs == 0)
+    active = np.nonzero(~zero_both)[0]
+
+    with np.errstate(divide="ignore"):
+        ratios = (match_freqs[active]
+                  / unmatch_freqs[active]).astype(np.float32)
+
+    # Descending by ratio; stable so ties keep code order, as before.
+    order = active[np.argsort(-ratios, kind="stable")]
+    m_sorted = match_freqs[order]
+    u_sorted = unmatch_freqs[order]
+
+    cum_u = 0
+    front = 0
+    while front < len(order) and cum_u + u_sorted[front] <= mu:
+        cum_u += u_sorted[front]
+        front += 1
+
+    cum_m = 0
+    back = len(order) - 1
+    while back >= front and cum_m + m_sorted[back] <= lambda_:
+        cum_m += m_sorted[back]
+        back -= 1
+
+    possible_codes = np.concatenate([np.nonzero(zero_both)[0],
+                                     order[front:back + 1]])
+
+    return order[:front], possible_codes, order[back + 1:]
+
+
+def make_final_dfs(zagat, fodors, zi, fi):
+    '''
+    Assemble an output dataframe from parallel arrays of zagat and
+    fodors positions by joining the two listings side by side.
+
+    Inputs:
+        zagat (df): Zagat listings
+        fodors (df): Fodor's listings
+        zi (array): zagat row positions
+        fi (array): fodors row positions
+
+    Returns: dataframe of joined pairs
+    '''
+
+    z = zagat.iloc[zi].reset_index(drop=True).add_suffix("_z")
+    f = fodors.iloc[fi].reset_index(drop=True).add_suffix("_f")
+    return pd.concat([z, f], axis=1)
+
+
+def classify_pairs(zagat, fodors, label_table):
+    '''
+    Score every (zagat row, fodors row) pair on the three columns and
+    classify it through the label table.
+
+    Inputs:
+        zagat (df): Zagat listings (or a city block of them)
+        fodors (df): Fodor's listings (or a city block of them)
+        label_table (array): 27-entry class label lookup table
+
+    Returns: int8 label matrix of shape (len(zagat), len(fodors))
+    '''
+
+    key = np.zeros((len(zagat), len(fodors)), dtype=np.int8)
+    for col, weight in (("rest", 9), ("city", 3), ("address", 1)):
+        # Score unique values only and gather the results back; within
+        # a city block the city column collapses to a single string.
+        z_uniq, z_inv = np.unique(zagat[col].to_numpy(),
+                                  return_inverse=True)
+        f_uniq, f_inv = np.unique(fodors[col].to_numpy(),
+                                  return_inverse=True)
+        uniq_sims = process.cdist(z_uniq, f_uniq,
+                                  scorer=JaroWinkler.normalized_similarity,
+                                  dtype=np.float32, workers=-1)
+        # Quantize to int8 categories while the matrix is still small;
+        # only category codes ever exist at full pair resolution.
+        uniq_cats = np.digitize(uniq_sims, CATEGORY_BINS).astype(np.int8)
+        del uniq_sims
+        key += uniq_cats[np.ix_(z_inv, f_inv)] * weight
+
+    return label_table[key]
+
+
+def find_matches(mu, lambda_, block_on_city=False):
+    '''
+    Link the Zagat and Fodor's listings.
+
+    Scores every (zagat, fodors) pair on restaurant name, city, and
+    address with Jaro-Winkler similarity, converts the scores to category
+    tuples, and classifies each pair as a match, possible match, or
+    unmatch based on tuple probabilities estimated from known links.
+
+    Inputs:
+        mu (float): maximum false positive rate
+        lambda_ (float): maximum false negative rate
+        block_on_city (bool): only consider pairs with identical city
+
+    Returns: (matches df, possible matches df, unmatches df)
+    '''
+
+    zagat, fodors, known = load_data()
+
+    match_freqs, unmatch_freqs = load_tuple_probs(zagat, fodors, known)
+    match_codes, possible_codes, unmatch_codes = \
+        create_sets(match_freqs, unmatch_freqs, mu, lambda_)
+
+    # Dispatch through a 27-entry lookup table: one gather instead of a
+    # set-membership test per class.
+    label_table = np.full(27, DROP, dtype=np.int8)
+    label_table[match_codes] = MATCH
+    label_table[unmatch_codes] = UNMATCH
+    label_table[possible_codes] = POSSIBLE
+
+    pairs = {MATCH: [], POSSIBLE: [], UNMATCH: []}
+    if block_on_city:
+        # Partition both frames by city once; pairs with different
+        # cities never need scoring at all.
+        z_blocks = zagat.groupby("city").indices
+        f_blocks = fodors.groupby("city").indices
+        cities = [city for city in z_blocks if city in f_blocks]
+
+        def classify_city(city):
+            return classify_pairs(zagat.iloc[z_blocks[city]],
+                                  fodors.iloc[f_blocks[city]],
+                                  label_table)
+
+        # City blocks are small, so per-block cdist calls rarely engage
+        # their own worker threads; run the blocks concurrently instead
+        # (rapidfuzz releases the GIL while scoring).
+        with ThreadPoolExecutor() as pool:
+            for city, labels in zip(cities,
+                                    pool.map(classify_city, cities)):
+                zi, fi = z_blocks[city], f_blocks[city]
+                for label in pairs:
+                    bz, bf = np.nonzero(labels == label)
+                    pairs[label].append((zi[bz], fi[bf]))
+    else:
+        labels = classify_pairs(zagat, fodors, label_table)
+        for label in pairs:
+            pairs[label].append(np.nonzero(labels == label))
+
+    def gather(label):
+        zi = np.concatenate([p[0] for p in pairs[label]])
+        fi = np.concatenate([p[1] for p in pairs[label]])
+        return make_final_dfs(zagat, fodors, zi, fi)
+
+    return gather(MATCH), gather(POSSIBLE), gather(UNMATCH)
+
+
+if __name__ == "__main__":
+    matches, possible, unmatches = find_matches(0.005, 0.005,
+                                                block_on_city=True)
+    print("matches:", len(matches))
+    print("possible matches:", len(possible))
+    print("unmatches:", len(unmatches))